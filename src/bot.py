@@ -1,74 +1,116 @@
 # bot.py (Versión Profesional Corregida)
 import os
 import time
+import uuid
+import queue
 import atexit
 import logging
-from decimal import Decimal, getcontext, ROUND_UP
-from typing import Dict, Optional, Tuple
-from threading import Thread, Lock, Event
-from functools import wraps
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from decimal import Decimal, getcontext, ROUND_DOWN
+from typing import Dict, List, Optional, Tuple
+from collections import OrderedDict
+from threading import Thread, Lock, RLock, Event
+from concurrent.futures import Future
+from functools import wraps, lru_cache
 import ccxt
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
 from src.config import config
 from src.exchange import exchange_client
 from src.database import db_manager
 from src.signals import signal_processor
+from src.ticker_stream import ticker_stream
+from src.json_provider import OrjsonProvider
 
 # =============================================
 # CONFIGURACIÓN GLOBAL
 # =============================================
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 getcontext().prec = 12  # Precisión para cálculos financieros
 
-# Configuración profesional de logging
+# Constantes decimales precalculadas (evita re-parsear cadenas en cada operación)
+ZERO = Decimal('0')
+ONE = Decimal('1')
+SATOSHI = Decimal('0.00000001')
+CENT = Decimal('0.01')
+DEFAULT_TRAILING = Decimal('0.02')
+INITIAL_CAPITAL = Decimal(str(config.INITIAL_CAPITAL))
+
+# Intervalos del bucle de trailing stop (segundos)
+POLL_INTERVAL = 30
+FAST_POLL_INTERVAL = 5
+FAST_POLL_THRESHOLD_BP = 50  # Movimiento >= 0.5% (en puntos básicos) activa el sondeo rápido
+
+# Punto fijo entero (unidades de 1e-8) para las comparaciones por tick
+SATS = 10 ** 8
+NO_TAKE_PROFIT_I = (1 << 63) - 1  # Techo inalcanzable cuando no hay take profit
+
+def price_to_decimal(value) -> Decimal:
+    """Precio de ccxt (float o str) a Decimal de 8 decimales con una sola conversión"""
+    return Decimal(repr(value) if isinstance(value, float) else value).quantize(SATOSHI)
+
+@lru_cache(maxsize=64)
+def to_decimal(value) -> Decimal:
+    """Conversión cacheada float/str -> Decimal (los webhooks repiten pocos valores)"""
+    return Decimal(str(value))
+
+# Tope de hilos de trailing: una compra más allá del límite se rechaza
+MAX_TRAILING_THREADS = config.MAX_TRAILING_THREADS
+
+# Cola acotada de órdenes: el webhook encola y un único worker habla con el exchange
+ORDER_QUEUE_SIZE = 64
+ORDER_RESULTS_MAX = 1024
+
+# Campos mínimos del webhook (el resto lo valida SignalProcessor)
+WEBHOOK_REQUIRED_FIELDS = frozenset(('action', 'symbol'))
+
+# Configuración profesional de logging: los hilos de trading solo encolan,
+# la escritura a consola/disco la hace un hilo QueueListener
+LOG_MAX_BYTES = 10_000_000
+LOG_BACKUP_COUNT = 5
+
+_log_queue = queue.Queue(-1)
+_log_listener = QueueListener(
+    _log_queue,
+    logging.StreamHandler(),
+    RotatingFileHandler('trading.log', maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT),
+    respect_handler_level=True
+)
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s | %(levelname)-8s | %(name)-22s | %(message)s',
     datefmt='%Y-%m-%d %H:%M:%S',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('trading.log')
-    ]
+    handlers=[QueueHandler(_log_queue)]
 )
+_log_listener.start()
+atexit.register(_log_listener.stop)
 logger = logging.getLogger('TradingEngine')
 
 # =============================================
 # DECORADORES MEJORADOS
 # =============================================
-def synchronized(lock_name: str):
-    """Decorador thread-safe con timeout y registro"""
-    def decorator(func):
-        @wraps(func)
-        def wrapper(self, *args, **kwargs):
-            lock = getattr(self, lock_name)
-            try:
-                if not lock.acquire(timeout=15):
-                    logger.error("Timeout adquiriendo lock")
-                    raise TimeoutError("No se pudo adquirir el recurso")
-                return func(self, *args, **kwargs)
-            finally:
-                lock.release()
-        return wrapper
-    return decorator
+@app.before_request
+def reject_non_json_posts():
+    """Corta los POST sin JSON antes del enrutado y de get_json()"""
+    if request.method == 'POST' and not request.is_json:
+        logger.warning(f"Intento de webhook no JSON desde {request.remote_addr}")
+        return jsonify({"error": "Se requiere application/json"}), 400
 
 def validate_webhook(f):
     """Validador profesional de webhooks con auditoría"""
     @wraps(f)
     def wrapper(*args, **kwargs):
-        start_time = time.time()
+        start_time = time.perf_counter()
         client_ip = request.remote_addr
         
         try:
-            if not request.is_json:
-                logger.warning(f"Intento de webhook no JSON desde {client_ip}")
-                return jsonify({"error": "Se requiere application/json"}), 400
-                
-            data = request.get_json()
-            logger.info(f"Webhook recibido desde {client_ip}: {data}")
+            data = request.get_json(cache=True, silent=True)
+            logger.debug("Webhook recibido desde %s: %s", client_ip, data)
+            if not isinstance(data, dict):
+                return jsonify({"error": "JSON inválido"}), 400
             
             # Validación de campos esenciales
-            required = {'action', 'symbol'}
-            if missing := required - set(data.keys()):
+            if missing := WEBHOOK_REQUIRED_FIELDS.difference(data):
                 logger.warning(f"Campos faltantes desde {client_ip}: {', '.join(missing)}")
                 return jsonify({"error": f"Campos requeridos: {', '.join(missing)}"}), 400
                 
@@ -77,9 +119,10 @@ def validate_webhook(f):
             if not processed_signal:
                 return jsonify({"error": "Señal inválida"}), 400
                 
+            g.webhook_data = data
             return f(*args, **kwargs)
         finally:
-            logger.info(f"Webhook procesado en {time.time() - start_time:.2f}s")
+            logger.info(f"Webhook procesado en {time.perf_counter() - start_time:.2f}s")
     return wrapper
 
 # =============================================
@@ -87,248 +130,545 @@ def validate_webhook(f):
 # =============================================
 class TradingBot:
     def __init__(self):
-        self._lock = Lock()
+        self._lock = Lock()  # Protege únicamente el capital compartido
+        self._symbol_locks: Dict[str, RLock] = {}
+        self._pending_buys = set()
         self._shutdown_event = Event()
-        self._state = self._load_initial_state()
+        self._trailing_threads: Dict[str, Thread] = {}
+        self._positions, self._capital = self._load_initial_state()
+        self._publish_snapshot()
         self._setup_logging()
+        ticker_stream.add_listener(self._on_tick)
+        for symbol in list(self._positions):
+            exchange_client.subscribe_ticker(symbol)
+            self.start_trailing(symbol)
         logger.info("Motor de trading inicializado")
 
     def _setup_logging(self):
-        """Configuración avanzada de logs de trading"""
+        """Configuración avanzada de logs de trading (escritura en hilo aparte)"""
         self._trade_logger = logging.getLogger('TradeAudit')
-        handler = logging.FileHandler('trades.log')
+        self._trade_log_listener = None
+        if self._trade_logger.handlers:
+            # Ya configurado (re-import bajo el reloader de Flask): evita escrituras duplicadas
+            return
+        handler = RotatingFileHandler('trades.log', maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
         handler.setFormatter(logging.Formatter('%(asctime)s | %(message)s'))
-        self._trade_logger.addHandler(handler)
+        trade_queue = queue.Queue(-1)
+        self._trade_logger.addHandler(QueueHandler(trade_queue))
         self._trade_logger.propagate = False
+        self._trade_log_listener = QueueListener(trade_queue, handler, respect_handler_level=True)
+        self._trade_log_listener.start()
 
-    def _load_initial_state(self) -> Dict:
-        """Carga estado inicial desde DB con manejo de errores"""
+    @staticmethod
+    def _new_position(symbol: str, entry_price: Decimal, size: Decimal, trailing: Decimal,
+                      take_profit: Optional[Decimal] = None) -> Dict:
+        """
+        Estado en memoria de una posición abierta.
+        `bounds_i` = (stop, take profit) en enteros 1e-8: se vende si el precio sale del rango.
+        """
+        return {
+            'symbol': symbol,
+            'market': exchange_client._normalize_symbol(symbol),
+            'entry_price': entry_price,
+            'size': size,
+            'trailing_stop': trailing,
+            'current_stop': entry_price * (ONE - trailing),
+            'take_profit': take_profit,
+            'bounds_i': (
+                int(entry_price * (ONE - trailing) * SATS),
+                int(take_profit * SATS) if take_profit else NO_TAKE_PROFIT_I
+            ),
+            'trail_factor_i': int((ONE - trailing) * SATS),
+            'last_price_i': 0,
+            'fast_poll': False,
+            'closing': False,
+            'order_id': None,
+            'price_update': Event()
+        }
+
+    def _load_initial_state(self) -> Tuple[Dict[str, Dict], Decimal]:
+        """Carga posiciones abiertas y capital desde DB con manejo de errores"""
+        positions: Dict[str, Dict] = {}
+        capital = INITIAL_CAPITAL
         try:
             result = db_manager.execute_query(
-                "SELECT * FROM positions WHERE closed = FALSE ORDER BY created_at DESC LIMIT 1"
+                "SELECT symbol, entry_price, amount, trailing_pct FROM positions "
+                "WHERE status = 'open' ORDER BY created_at DESC"
             )
-            if result:
-                position = result[0]
-                return {
-                    'active': True,
-                    'symbol': position['symbol'],
-                    'entry_price': Decimal(str(position['entry_price'])),
-                    'size': Decimal(str(position['size'])),
-                    'trailing_stop': Decimal(str(position['trailing_stop'])),
-                    'capital': Decimal(str(position['remaining_capital']))
-                }
+            for symbol, entry_price, amount, trailing_pct in result or []:
+                symbol = exchange_client._normalize_symbol(symbol)
+                positions[symbol] = self._new_position(
+                    symbol,
+                    Decimal(str(entry_price)),
+                    Decimal(str(amount)),
+                    Decimal(str(trailing_pct))
+                )
+            balance = db_manager.get_capital()
+            if balance is not None:
+                capital = Decimal(str(balance))
         except Exception as e:
             logger.error(f"Error cargando estado: {str(e)}")
-        
-        return {
-            'active': False,
-            'symbol': None,
-            'entry_price': Decimal('0'),
-            'size': Decimal('0'),
-            'trailing_stop': Decimal('0.02'),
-            'capital': Decimal(str(config.INITIAL_CAPITAL))
-        }
-    @synchronized('_lock')
-    def execute_sell(self) -> Tuple[bool, str]:
+        return positions, capital
+
+    def _symbol_lock(self, symbol: str) -> RLock:
+        """
+        Lock por símbolo (lock striping): símbolos distintos no se bloquean entre sí.
+        Reentrante para que un execute_sell anidado no pueda interbloquearse.
+        """
+        lock = self._symbol_locks.get(symbol)
+        if lock is None:
+            lock = self._symbol_locks.setdefault(symbol, RLock())
+        return lock
+
+    @property
+    def capital(self) -> Decimal:
+        return self._capital
+
+    @property
+    def open_symbols(self) -> List[str]:
+        return list(self._positions)
+
+    @property
+    def snapshot(self) -> Tuple[Decimal, Tuple[str, ...]]:
+        """(capital, símbolos abiertos) coherentes entre sí; lectura sin lock"""
+        return self._snapshot
+
+    def _publish_snapshot(self):
+        """Publica el estado tras cada operación completa (una sola asignación atómica)"""
+        self._snapshot = (self._capital, tuple(self._positions))
+
+    def has_position(self, symbol: str) -> bool:
+        return exchange_client._normalize_symbol(symbol) in self._positions
+
+    def execute_sell(self, symbol: str) -> Tuple[bool, str]:
         """Ejecución de venta con reinversión de capital"""
-        try:
-            if not self._state['active']:
+        # Estado, locks y filas de DB van por el símbolo unificado (BTC-EUR == btc/eur)
+        symbol = exchange_client._normalize_symbol(symbol)
+        # Reclamo de la posición: el lock solo cubre la transición de estado
+        with self._symbol_lock(symbol):
+            position = self._positions.get(symbol)
+            if position is None:
                 return False, "Sin posición activa"
-            
-            # Obtención de precio de mercado
-            ticker = exchange_client.fetch_ticker(self._state['symbol'])
-            price = Decimal(str(ticker['bid'])).quantize(Decimal('0.00000001'))
+            if position['closing']:
+                return False, "Venta ya en curso"
+            position['closing'] = True
+
+        try:
+            # Bid del feed WebSocket (la posición está suscrita); REST solo como respaldo
+            price = price_to_decimal(exchange_client.get_bid(symbol))
             
             # Intentar orden limitada primero
             try:
                 order = exchange_client.create_limit_order(
-                    symbol=self._state['symbol'],
+                    symbol=symbol,
                     side='sell',
-                    amount=float(self._state['size']),
+                    amount=float(position['size']),
                     price=float(price)
                 )
             except ccxt.InvalidOrder as e:
                 logger.warning(f"Orden limitada rechazada: {str(e)}. Intentando market order...")
                 order = exchange_client.create_market_order(
-                    symbol=self._state['symbol'],
+                    symbol=symbol,
                     side='sell',
-                    amount=float(self._state['size'])
+                    amount=float(position['size'])
                 )
-            
-            # Cálculo preciso de ganancias
-            sale_proceeds = self._state['size'] * price
-            new_capital = self._state['capital'] + sale_proceeds
-            profit = new_capital - config.INITIAL_CAPITAL
-            
-            # Actualización de estado
-            self._state.update({
-                'active': False,
-                'capital': new_capital.quantize(Decimal('0.01')),
-                'symbol': None,
-                'size': Decimal('0')
-            })
-            
-            # Actualización transaccional en DB
-            db_manager.transactional([
-                ("UPDATE positions SET exit_price = %s, closed = TRUE WHERE closed = FALSE",
-                (float(price),)),
-                ("UPDATE capital SET balance = %s", (float(new_capital),))
-            ])
-            
-            self._trade_logger.info(
-                f"VENTA | {self._state['symbol']} | "
-                f"Precio: {price:.8f} | Beneficio: {profit:.2f}€ | "
-                f"Nuevo capital: {new_capital:.2f}€"
-            )
-            
-            return True, order['id']
-            
         except Exception as e:
+            with self._symbol_lock(symbol):
+                position['closing'] = False
             logger.critical(f"Error en venta: {str(e)}", exc_info=True)
             return False, str(e)
 
-    @synchronized('_lock')
-    def execute_buy(self, symbol: str, trailing: Decimal) -> Tuple[bool, str]:
-        """Ejecución de compra con configuración de trailing stop"""
+        # Cálculo preciso de ganancias
+        sale_proceeds = position['size'] * price
+        with self._lock:
+            self._capital = new_capital = (self._capital + sale_proceeds).quantize(CENT)
+        # Beneficio de la operación (mismo valor en DB y en el log de trades)
+        profit = sale_proceeds - position['size'] * position['entry_price']
+        
+        # Actualización de estado
+        with self._symbol_lock(symbol):
+            self._positions.pop(symbol, None)
+        self._publish_snapshot()
+        position['price_update'].set()
+        exchange_client.unsubscribe_ticker(symbol)
+        
         try:
-            ticker = exchange_client.fetch_ticker(symbol)
-            price = Decimal(str(ticker['ask'])).quantize(Decimal('0.00000001'))
-            amount = (self._state['capital'] / price).quantize(Decimal('0.00000001'), rounding=ROUND_UP)
-            order = exchange_client.create_market_order(
-                symbol=symbol,
-                side='buy',
-                amount=float(amount)
+            # Actualización transaccional en DB
+            # Cierre y capital en una sola sentencia (un round trip, una transacción)
+            db_manager.execute_query(
+                "WITH closed AS ("
+                "UPDATE positions SET status = 'closed', exit_price = %s, profit = %s "
+                "WHERE status = 'open' AND symbol = %s"
+                ") UPDATE capital SET balance = %s WHERE id = 1",
+                (float(price), float(profit), symbol, float(new_capital))
             )
-            self._state['order_id'] = order['id']
-            self._state.update({
-                'active': True,
-                'symbol': symbol,
-                'entry_price': price,
-                'size': amount,
-                'trailing_stop': trailing
-            })
-            initial_stop = price * (Decimal('1') - trailing)
-            self._state['current_stop'] = initial_stop
-            self._state['capital'] -= price * amount
-            db_manager.transactional([
-                ("INSERT INTO positions (symbol, entry_price, size, trailing_stop) VALUES (%s, %s, %s, %s)",
-                 (symbol, float(price), float(amount), float(trailing)))
-            ])
-            self._trade_logger.info(
-                f"COMPRA | {symbol} | Precio: {price:.8f} | Tamaño: {amount} | Trailing: {trailing}"
+        except Exception as e:
+            logger.critical(f"Error persistiendo venta: {str(e)}", exc_info=True)
+        
+        self._trade_logger.info(
+            f"VENTA | {symbol} | "
+            f"Precio: {price:.8f} | Beneficio: {profit:.2f}€ | "
+            f"Nuevo capital: {new_capital:.2f}€"
+        )
+        
+        return True, order['id']
+
+    def execute_buy(self, symbol: str, trailing: Decimal,
+                    take_profit: Optional[Decimal] = None) -> Tuple[bool, str]:
+        """Ejecución de compra con configuración de trailing stop"""
+        symbol = exchange_client._normalize_symbol(symbol)
+        # Reclamo del símbolo: el lock solo cubre la transición de estado
+        with self._symbol_lock(symbol):
+            if symbol in self._positions or symbol in self._pending_buys:
+                return False, f"Ya hay posición abierta para {symbol}"
+            with self._lock:
+                # Cada posición tiene su hilo de trailing: el tope de posiciones acota los hilos
+                if len(self._positions) + len(self._pending_buys) >= MAX_TRAILING_THREADS:
+                    return False, f"Máximo de {MAX_TRAILING_THREADS} posiciones abiertas alcanzado"
+                self._pending_buys.add(symbol)
+
+        try:
+            # Reserva del capital: una compra concurrente de otro símbolo no puede reutilizarlo
+            with self._lock:
+                capital, self._capital = self._capital, ZERO
+            if capital <= ZERO:
+                with self._lock:
+                    self._capital += capital
+                return False, "Capital insuficiente"
+
+            try:
+                trailing = to_decimal(trailing)
+                ticker = exchange_client.fetch_ticker(symbol)
+                price = price_to_decimal(ticker['ask'])
+                amount = (capital / price).quantize(SATOSHI, rounding=ROUND_DOWN)
+                # El capital sobrante de otra compra puede ser solo polvo: se rechaza aquí, no en Kraken
+                min_amount = exchange_client.get_min_order_size(symbol)
+                if amount < min_amount:
+                    with self._lock:
+                        self._capital += capital
+                    return False, f"Monto mínimo no alcanzado: {min_amount}"
+                order = exchange_client.create_market_order(
+                    symbol=symbol,
+                    side='buy',
+                    amount=float(amount)
+                )
+            except Exception as e:
+                with self._lock:
+                    self._capital += capital
+                logger.critical(f"Error en compra: {str(e)}", exc_info=True)
+                return False, str(e)
+
+            with self._lock:
+                self._capital += capital - price * amount
+                remaining_capital = self._capital
+            if take_profit is not None and take_profit <= price:
+                # Un take profit ya alcanzado vendería en el primer tick
+                logger.warning(f"Take profit {take_profit} no supera la entrada {price:.8f} en {symbol}; se ignora")
+                take_profit = None
+            position = self._new_position(symbol, price, amount, trailing, take_profit)
+            position['order_id'] = order['id']
+            with self._symbol_lock(symbol):
+                self._positions[symbol] = position
+        finally:
+            with self._symbol_lock(symbol):
+                self._pending_buys.discard(symbol)
+            self._publish_snapshot()
+
+        try:
+            # Posición y capital en una sola sentencia (un round trip, una transacción)
+            db_manager.execute_query(
+                "WITH opened AS ("
+                "INSERT INTO positions (symbol, side, amount, entry_price, trailing_pct, highest_price, stop_price, status) "
+                "VALUES (%s, 'buy', %s, %s, %s, %s, %s, 'open')"
+                ") UPDATE capital SET balance = %s WHERE id = 1",
+                (symbol, float(amount), float(price), float(trailing), float(price),
+                 float(position['current_stop']), float(remaining_capital))
             )
-            return True, order['id']
         except Exception as e:
-            logger.critical(f"Error en compra: {str(e)}", exc_info=True)
-            return False, str(e)
+            logger.critical(f"Error persistiendo compra: {str(e)}", exc_info=True)
+        self._trade_logger.info(
+            f"COMPRA | {symbol} | Precio: {price:.8f} | Tamaño: {amount} | Trailing: {trailing}"
+        )
+        return True, order['id']
+
+    def _on_tick(self, market: str, price: float):
+        """Callback del feed WebSocket: entrega el precio y despierta el trailing de la posición"""
+        for position in list(self._positions.values()):
+            if position['market'] == market:
+                position['tick_price'] = price
+                position['price_update'].set()
+
+    def notify_price_update(self, symbol: Optional[str] = None):
+        """Despierta los bucles de trailing stop antes de que venza su espera"""
+        positions = list(self._positions.values()) if symbol is None else [self._positions.get(symbol)]
+        for position in positions:
+            if position is not None:
+                position['price_update'].set()
 
-    def manage_orders(self):
-        """Gestión activa de órdenes con trailing stop"""
-        logger.info("Iniciando monitorización de posiciones")
+    @staticmethod
+    def _next_interval(position: Dict) -> float:
+        """Sondeo adaptativo: más frecuente cuando el precio se mueve rápido"""
+        if position['fast_poll']:
+            return FAST_POLL_INTERVAL
+        return POLL_INTERVAL
+
+    @staticmethod
+    def _wait_for_price(position: Dict, timeout: float):
+        """Espera interrumpible por nuevo precio, señal del webhook o apagado"""
+        position['price_update'].wait(timeout=timeout)
+        position['price_update'].clear()
+
+    def start_trailing(self, symbol: str):
+        """
+        Lanza el bucle de trailing del símbolo si no hay uno ya en marcha.
+        Un hilo dedicado por posición: ninguna posición espera a que otra se cierre
+        (execute_buy limita las posiciones, y con ello los hilos, a MAX_TRAILING_THREADS).
+        Hilo daemon: el intérprete no lo espera al salir y atexit puede ejecutar shutdown().
+        """
+        with self._symbol_lock(symbol):
+            thread = self._trailing_threads.get(symbol)
+            if thread is not None and thread.is_alive():
+                return
+            thread = Thread(target=self.manage_orders, args=(symbol,), daemon=True, name=f"Trailing-{symbol}")
+            self._trailing_threads[symbol] = thread
+            thread.start()
+
+    def _on_price(self, symbol: str, position: Dict, price: float) -> bool:
+        """
+        Evalúa un precio nuevo: sube el stop si procede y devuelve True si hay que vender
+        (precio en o por debajo del stop, o en o por encima del take profit).
+        Todo en enteros (1e-8); el Decimal solo se reconstruye al mover el stop.
+        """
+        price_i = round(price * SATS)
+        with self._symbol_lock(symbol):
+            if symbol not in self._positions or position['closing']:
+                return False
+            last_i = position['last_price_i']
+            position['fast_poll'] = bool(last_i) and abs(price_i - last_i) * 10000 >= last_i * FAST_POLL_THRESHOLD_BP
+            position['last_price_i'] = price_i
+
+            # Actualización dinámica del stop
+            stop_i, take_profit_i = position['bounds_i']
+            new_stop_i = price_i * position['trail_factor_i'] // SATS
+            if new_stop_i > stop_i:
+                stop_i = new_stop_i
+                position['bounds_i'] = (stop_i, take_profit_i)
+                position['current_stop'] = Decimal(stop_i).scaleb(-8)
+                logger.info(f"Trailing actualizado {symbol}: {position['current_stop']:.8f}")
+
+            return not stop_i < price_i < take_profit_i
+
+    def manage_orders(self, symbol: str):
+        """Gestión activa de órdenes con trailing stop para un símbolo"""
+        logger.info(f"Iniciando monitorización de {symbol}")
         while not self._shutdown_event.is_set():
+            # Salida y baja del registro atómicas: una recompra no puede quedar sin hilo
+            with self._symbol_lock(symbol):
+                position = self._positions.get(symbol)
+                if position is None:
+                    self._trailing_threads.pop(symbol, None)
+                    break
             try:
-                if not self._state['active']:
-                    time.sleep(15)
-                    continue
-                
-                # Lógica de trailing stop actualizada
-                ticker = exchange_client.fetch_ticker(self._state['symbol'])
-                current_price = Decimal(str(ticker['last']))
-                new_stop = current_price * (1 - self._state['trailing_stop'])
+                # Precio empujado por el WebSocket; REST solo como respaldo
+                price = position.pop('tick_price', None)
+                if price is None:
+                    price = exchange_client.get_price(symbol)
                 
-                # Actualización dinámica del stop
-                if new_stop > self._state.get('current_stop', Decimal('0')):
-                    exchange_client.update_order(
-                        order_id=self._state['order_id'],
-                        new_stop=float(new_stop))
-                    self._state['current_stop'] = new_stop
-                    logger.info(f"Trailing actualizado: {new_stop:.8f}")
+                # La venta se lanza fuera del lock del símbolo (execute_sell lo toma)
+                if self._on_price(symbol, position, float(price)):
+                    logger.info(f"Salida activada para {symbol} (stop {position['current_stop']:.8f}, take profit {position['take_profit']})")
+                    success, result = self.execute_sell(symbol)
+                    if not success:
+                        logger.error(f"Venta por trailing fallida para {symbol}: {result}")
+                        self._shutdown_event.wait(60)
+                    continue
                 
-                time.sleep(30)
+                self._wait_for_price(position, self._next_interval(position))
                 
             except Exception as e:
                 logger.error(f"Error en monitorización: {str(e)}")
-                time.sleep(60)
+                self._shutdown_event.wait(60)
+        logger.info(f"Monitorización finalizada para {symbol}")
 
     def shutdown(self):
         """Protoculo de apagado seguro"""
         logger.info("Iniciando secuencia de apagado...")
         self._shutdown_event.set()
+        self.notify_price_update()
         
-        try:
-            if self._state['active']:
-                logger.warning("Liquidando posición activa...")
-                self.execute_sell()
-        except Exception as e:
-            logger.error(f"Error durante el apagado: {str(e)}")
+        for symbol in self.open_symbols:
+            try:
+                logger.warning(f"Liquidando posición activa {symbol}...")
+                self.execute_sell(symbol)
+            except Exception as e:
+                logger.error(f"Error durante el apagado: {str(e)}")
         
         db_manager.close()
         logger.info("Sistema apagado correctamente")
+        if self._trade_log_listener is not None:
+            self._trade_log_listener.stop()
+
+@lru_cache(maxsize=1)
+def get_bot() -> TradingBot:
+    """Instancia única y perezosa del bot (un solo cliente, un solo set de handlers)"""
+    bot = TradingBot()
+    atexit.register(bot.shutdown)
+    # El worker nace con el bot, no al importar el módulo (herramientas y tests no operan)
+    Thread(target=_order_worker, daemon=True, name="OrderWorker").start()
+    return bot
+
+# =============================================
+# COLA DE ÓRDENES (FUERA DEL HILO HTTP)
+# =============================================
+_order_queue: queue.Queue = queue.Queue(maxsize=ORDER_QUEUE_SIZE)
+_order_results: "OrderedDict[str, Future]" = OrderedDict()
+_order_results_lock = Lock()
+
+def _process_order(job: Dict) -> Dict:
+    """Ejecuta una orden encolada y devuelve el cuerpo de respuesta"""
+    bot = get_bot()
+    symbol = job['symbol']
+    if job['action'] == 'buy':
+        success, order_id = bot.execute_buy(symbol, job['trailing_stop'], job.get('take_profit'))
+        if not success:
+            return {"status": "error", "error": order_id}
+        exchange_client.subscribe_ticker(symbol)
+        bot.start_trailing(symbol)
+        return {
+            "status": "success",
+            "order_id": order_id,
+            "symbol": symbol,
+            "capital_restante": float(bot.capital)
+        }
+
+    success, order_id = bot.execute_sell(symbol)
+    return {
+        "status": "success" if success else "error",
+        "order_id": order_id,
+        "nuevo_capital": float(bot.capital)
+    }
+
+def _order_worker():
+    """Consumidor único de la cola de órdenes"""
+    while True:
+        job_id, job = _order_queue.get()
+        with _order_results_lock:
+            future = _order_results.get(job_id)
+        try:
+            result = _process_order(job)
+            if future is not None:
+                future.set_result(result)
+        except Exception as e:
+            logger.error(f"Error procesando orden {job_id}: {str(e)}", exc_info=True)
+            db_manager.log_error("order_worker_error", str(e))
+            if future is not None:
+                future.set_exception(e)
+        finally:
+            _order_queue.task_done()
+
+def enqueue_order(job: Dict) -> str:
+    """Encola la orden y devuelve su id de seguimiento (lanza queue.Full si está llena)"""
+    job_id = uuid.uuid4().hex
+    with _order_results_lock:
+        _order_results[job_id] = Future()
+        while len(_order_results) > ORDER_RESULTS_MAX:
+            _order_results.popitem(last=False)
+    try:
+        _order_queue.put_nowait((job_id, job))
+    except queue.Full:
+        with _order_results_lock:
+            _order_results.pop(job_id, None)
+        raise
+    return job_id
 
 # =============================================
 # ENDPOINTS API PROFESIONALES
 # =============================================
-@app.route('/health', methods=['GET'])
-def health_check():
-    """Endpoint de salud completo"""
+@lru_cache(maxsize=4)
+def _health_snapshot(bucket: int) -> Tuple[str, int]:
+    """
+    Cuerpo JSON y código de /health para un segundo dado: una ráfaga de sondas
+    comparte una sola consulta a DB y a Kraken.
+    """
+    capital, symbols = get_bot().snapshot
     try:
         db_status = "OK" if db_manager.execute_query("SELECT 1") else "Error"
         exchange_status = "OK" if exchange_client.check_connection() else "Error"
-        return jsonify({
+        return app.json.dumps({
             "status": "Operacional",
             "database": db_status,
             "exchange": exchange_status,
-            "capital": float(bot._state['capital']),
-            "posición_activa": bot._state['active']
+            "capital": float(capital),
+            "posición_activa": bool(symbols),
+            "posiciones": list(symbols)
         }), 200
     except Exception as e:
         logger.error(f"Health check fallido: {str(e)}")
-        return jsonify({"status": "Error"}), 500
+        return app.json.dumps({"status": "Error"}), 500
+
+@app.route('/health', methods=['GET'])
+def health_check():
+    """Endpoint de salud completo (cacheado por segundo)"""
+    body, status = _health_snapshot(int(time.monotonic()))
+    return app.response_class(body, status=status, mimetype='application/json')
 
 @app.route('/webhook', methods=['POST'])
 @validate_webhook
 def handle_webhook():
     """Manejador profesional de webhooks"""
-    data = request.get_json()
+    bot = get_bot()
+    data = g.webhook_data
     action = data['action'].lower()
     
+    try:
+        # Una sola normalización en la entrada: todo el estado del bot va por el símbolo unificado
+        symbol = exchange_client._normalize_symbol(data['symbol'])
+    except ValueError as e:
+        logger.warning(f"Símbolo rechazado: {str(e)}")
+        return jsonify({"error": "Símbolo no soportado"}), 400
+    
     try:
         if action == 'buy':
-            symbol = data['symbol']
             trailing_cfg = float(data.get("trailing_stop", 0.02))
             logger.info(f"🔔 Señal recibida para {symbol}")
-            # Normalización y obtención del mercado
-            # normalized = exchange_client._normalize_symbol(symbol)
-            # market = exchange_client.client.market(normalized)
-            if bot._state['active'] and bot._state['symbol'] == symbol:
+            if bot.has_position(symbol):
                 logger.info(f"❌ Ya hay posición abierta para {symbol}")
-            else:
-                logger.info(f"✅ No hay posición abierta, ejecutando compra")
-            success, order_id = bot.execute_buy(symbol, trailing_cfg)
-            if success:
-                Thread(target=bot.manage_orders, daemon=True).start()
-                return jsonify({
-                    "status": "success",
-                    "order_id": order_id,
-                    "symbol": bot._state['symbol'],
-                    "capital_restante": float(bot._state['capital'])
-                }), 200
-            return jsonify({"error": order_id}), 400
+                return jsonify({"error": f"Ya hay posición abierta para {symbol}"}), 400
+            logger.info(f"✅ No hay posición abierta, encolando compra")
+            job = {'action': 'buy', 'symbol': symbol, 'trailing_stop': trailing_cfg}
+            if data.get('take_profit'):
+                job['take_profit'] = price_to_decimal(float(data['take_profit']))
             
         elif action == 'sell':
-            success, order_id = bot.execute_sell()
-            return jsonify({
-                "status": "success" if success else "error",
-                "order_id": order_id,
-                "nuevo_capital": float(bot._state['capital'])
-            }), 200 if success else 400
+            job = {'action': 'sell', 'symbol': symbol}
             
-        return jsonify({"error": "Acción no válida"}), 400
+        else:
+            return jsonify({"error": "Acción no válida"}), 400
+
+        job_id = enqueue_order(job)
+        return jsonify({"status": "queued", "id": job_id}), 202
+    except queue.Full:
+        logger.warning("Cola de órdenes llena, señal rechazada")
+        return jsonify({"error": "Servicio ocupado, reintente"}), 503
     except Exception as e:
         logger.error(f"Error en webhook: {str(e)}")
         db_manager.log_error("webhook_error", str(e))
         return jsonify({"error": "Error interno del servidor"}), 500
 
+@app.route('/order/<job_id>', methods=['GET'])
+def order_status(job_id: str):
+    """Estado de una orden encolada por el webhook"""
+    with _order_results_lock:
+        future = _order_results.get(job_id)
+    if future is None:
+        return jsonify({"error": "Orden desconocida"}), 404
+    if not future.done():
+        return jsonify({"status": "queued", "id": job_id}), 202
+    if future.exception() is not None:
+        return jsonify({"status": "error", "id": job_id, "error": "Error interno del servidor"}), 500
+    result = future.result()
+    return jsonify({**result, "id": job_id}), 200 if result['status'] == 'success' else 400
+
 # =============================================
 # INICIALIZACIÓN ROBUSTA
 # =============================================
@@ -345,8 +685,7 @@ def run_server():
 
 if __name__ == '__main__':
     try:
-        bot = TradingBot()
-        atexit.register(bot.shutdown)
+        get_bot()
         logger.info(f"""
         ==============================
         🚀 Crypto Trading Bot (v1.2.0)
@@ -6,6 +6,14 @@ INITIAL_CAPITAL  = float(os.getenv("INITIAL_CAPITAL", 40.0))
 WEB_SERVER_PORT  = int(os.getenv("WEB_SERVER_PORT", 3000))
 # Intervalo (en segundos) para el watcher
 WATCH_INTERVAL   = float(os.getenv("WATCH_INTERVAL", 30.0))
+# Entorno de ejecución (production / staging / ...)
+ENVIRONMENT      = os.getenv("ENV", "production")
+# Servidor waitress: hilos de trabajo (I/O-bound: escalan con la espera de red, no con los cores)
+WAITRESS_THREADS         = int(os.getenv("WAITRESS_THREADS", max(8, (os.cpu_count() or 4) * 4)))
+WAITRESS_CONN_LIMIT      = int(os.getenv("WAITRESS_CONN_LIMIT", 1024))
+WAITRESS_CHANNEL_TIMEOUT = int(os.getenv("WAITRESS_CHANNEL_TIMEOUT", 600))
+# Máximo de posiciones abiertas a la vez (un hilo de trailing por posición)
+MAX_TRAILING_THREADS     = int(os.getenv("MAX_TRAILING_THREADS", 16))
 
 # Kraken API credentials
 KRAKEN_API_KEY = os.getenv("KRAKEN_API_KEY")
@@ -1,11 +1,11 @@
 # src/database.py
-import os
 import logging
 import json
 import psycopg2
 from psycopg2.pool import ThreadedConnectionPool
 from urllib.parse import urlparse
 from typing import Optional, Union, List, Tuple
+from src.config import DATABASE_URL, INITIAL_CAPITAL
 
 logger = logging.getLogger('Database')
 
@@ -22,11 +22,12 @@ class DatabaseManager:
         self._initialize_pool()
         self._test_connection()
         self._initialize_positions_table()
+        self._initialize_capital_table()
 
     def _initialize_pool(self) -> None:
         """Configuración profesional del connection pool"""
         try:
-            parsed = urlparse(os.getenv("DATABASE_URL"))
+            parsed = urlparse(DATABASE_URL)
             db_params = {
                 'host': parsed.hostname,
                 'port': parsed.port or 5432,
@@ -149,10 +150,36 @@ class DatabaseManager:
             highest_price NUMERIC NOT NULL,
             stop_price NUMERIC NOT NULL,
             status TEXT NOT NULL DEFAULT 'open',
+            exit_price NUMERIC,
+            profit NUMERIC,
             created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW()
         )
         """
         self.execute_query(create_table_sql)
+        # Tablas creadas antes de registrar el cierre
+        self.execute_query(
+            "ALTER TABLE positions ADD COLUMN IF NOT EXISTS exit_price NUMERIC, "
+            "ADD COLUMN IF NOT EXISTS profit NUMERIC"
+        )
+
+    def _initialize_capital_table(self) -> None:
+        """Fila única con el capital disponible (sembrada con INITIAL_CAPITAL)"""
+        create_table_sql = """
+        CREATE TABLE IF NOT EXISTS capital (
+            id INTEGER PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+            balance NUMERIC NOT NULL
+        )
+        """
+        self.execute_query(create_table_sql)
+        self.execute_query(
+            "INSERT INTO capital (id, balance) VALUES (1, %s) ON CONFLICT (id) DO NOTHING",
+            (INITIAL_CAPITAL,)
+        )
+
+    def get_capital(self) -> Optional[float]:
+        """Capital persistido, o None si la fila no existe"""
+        result = self.execute_query("SELECT balance FROM capital WHERE id = 1")
+        return result[0][0] if result else None
 
     def add_position(self, symbol: str, side: str, amount: float, entry_price: float, trailing_pct: float, highest_price: float, stop_price: float) -> int:
         insert_sql = """
@@ -1,9 +1,14 @@
-import os
 import time
+import hmac
+import hashlib
 import logging
+import threading
 import ccxt
+from requests.adapters import HTTPAdapter
 from decimal import Decimal, ROUND_UP, ROUND_DOWN
 from typing import Dict, Optional, Tuple, Any, List
+from src.ticker_stream import ticker_stream
+from src.config import KRAKEN_API_KEY, KRAKEN_SECRET
 
 logger = logging.getLogger("KrakenClient")
 logger.setLevel(logging.INFO)
@@ -25,17 +30,34 @@ class ExchangeClient:
         'DEFAULT': {'amount': 4, 'price': 4}
     }
 
+    DEFAULT_MIN_AMOUNT = Decimal('0.00000001')
+    # Pasos de cantidad 10^-p precalculados (p = 0..18)
+    AMOUNT_STEPS = tuple(Decimal(1).scaleb(-p) for p in range(19))
+
+    HTTP_POOL_CONNECTIONS = 4
+    HTTP_POOL_MAXSIZE = 16
+
+    # Vida de un ticker REST en caché: ráfagas (stop + venta) comparten una sola llamada
+    TICKER_CACHE_TTL = 0.5
+
+    # Entradas máximas de la caché símbolo de entrada -> símbolo unificado
+    NORMALIZED_CACHE_MAX = 512
+
+    # Recarga diaria de mercados (altas/bajas de pares y cambios de límites)
+    MARKETS_REFRESH_INTERVAL = 24 * 3600
+
     def __init__(self):
         self._last_nonce = int(time.time() * 1000)
+        self._nonce_lock = threading.Lock()
+        self._ticker_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self._ticker_cache_lock = threading.Lock()
         self._connection_retries = 0
         self.MAX_RETRIES = 3
         self.client = self._initialize_client()
         self._load_markets_with_retry(self.client)
-        self.SYMBOL_MAPPING = {
-            f"{v['base']}/{v['quote']}": k
-            for k, v in self.client.markets.items()
-        }
+        self._build_market_tables()
         self.validate_connection()
+        self._schedule_markets_refresh()
 
     def _initialize_time_sync(self):
         self.time_delta = 0
@@ -48,15 +70,15 @@ class ExchangeClient:
         return 2020 <= current_year <= 2100
 
     def _initialize_client(self) -> ccxt.kraken:
-        api_key = os.getenv("KRAKEN_API_KEY", "").strip()
-        api_secret = os.getenv("KRAKEN_SECRET", "").strip()
+        api_key = (KRAKEN_API_KEY or "").strip()
+        api_secret = (KRAKEN_SECRET or "").strip()
 
         if not api_key or not api_secret:
             logger.critical("❌ Faltan las variables de entorno KRAKEN_API_KEY o KRAKEN_SECRET")
         else:
             logger.info("✅ Claves de API Kraken cargadas")
 
-        return ccxt.kraken({
+        client = ccxt.kraken({
             'apiKey': api_key,
             'secret': api_secret,
             'timeout': 30000,  # 30 segundos
@@ -68,6 +90,47 @@ class ExchangeClient:
                 'numRetries': 3
             }
         })
+        self._configure_session(client)
+        # Generador de nonce único para toda la vida del cliente (estrictamente creciente entre hilos)
+        client.nonce = self._get_nonce
+        self._configure_signing(client)
+        return client
+
+    @staticmethod
+    def _configure_signing(client: ccxt.kraken) -> None:
+        """
+        Firma HMAC-SHA512 a partir de un prototipo con la clave ya cargada:
+        cada petición privada hace copy() + update() en vez de reinicializar la clave.
+        """
+        original_hmac = client.hmac
+        prototypes: Dict[bytes, Any] = {}
+
+        def cached_hmac(request, secret, algorithm=hashlib.sha256, digest='hex'):
+            if algorithm is not hashlib.sha512:
+                return original_hmac(request, secret, algorithm, digest)
+            prototype = prototypes.get(secret)
+            if prototype is None:
+                prototype = prototypes.setdefault(secret, hmac.new(secret, digestmod=hashlib.sha512))
+            mac = prototype.copy()
+            mac.update(request)
+            binary = mac.digest()
+            if digest == 'hex':
+                return client.encode(client.binary_to_base16(binary))
+            if digest == 'base64':
+                return client.encode(client.binary_to_base64(binary))
+            return binary
+
+        client.hmac = cached_hmac
+
+    def _configure_session(self, client: ccxt.kraken) -> None:
+        """Pool de conexiones keep-alive: reutiliza TCP+TLS entre llamadas REST"""
+        adapter = HTTPAdapter(
+            pool_connections=self.HTTP_POOL_CONNECTIONS,
+            pool_maxsize=self.HTTP_POOL_MAXSIZE,
+            max_retries=0  # Los reintentos los gestiona el propio cliente
+        )
+        client.session.mount('https://', adapter)
+        client.session.headers.update({'Connection': 'keep-alive'})
 
     def _load_markets_with_retry(self, exchange, max_retries=3):
         for attempt in range(max_retries):
@@ -84,6 +147,42 @@ class ExchangeClient:
                     raise
                 time.sleep(2 ** attempt)
 
+    def _build_market_tables(self) -> None:
+        """Precalcula símbolos y límites por mercado para no recorrerlos en cada orden"""
+        markets = self.client.markets
+        min_amounts: Dict[str, Decimal] = {}
+        for symbol, market in markets.items():
+            min_amount = ((market.get('limits') or {}).get('amount') or {}).get('min')
+            if min_amount is not None:
+                min_amounts[symbol] = Decimal(str(min_amount))
+
+        # Cada tabla se sustituye de una vez: los lectores nunca ven una a medio construir
+        self.SYMBOL_MAPPING = {f"{v['base']}/{v['quote']}": k for k, v in markets.items()}
+        self._valid_symbols = frozenset(markets)
+        self._compact_symbols = {k.replace('/', ''): k for k in markets}
+        self._min_amounts = min_amounts
+        self._normalized_symbols: Dict[str, str] = {}
+
+    def _schedule_markets_refresh(self) -> None:
+        timer = threading.Timer(self.MARKETS_REFRESH_INTERVAL, self.refresh_markets)
+        timer.daemon = True
+        timer.start()
+
+    def refresh_markets(self) -> None:
+        """Recarga los mercados y reconstruye las tablas precalculadas"""
+        try:
+            self.client.load_markets(reload=True)
+            self._build_market_tables()
+            logger.info(f"🔄 Mercados recargados ({len(self._valid_symbols)} pares)")
+        except Exception as e:
+            logger.warning(f"Error recargando mercados: {str(e)}. Se mantienen las tablas actuales")
+        finally:
+            self._schedule_markets_refresh()
+
+    def get_min_order_size(self, symbol: str) -> Decimal:
+        """Cantidad mínima de orden para el par (0.00000001 si el mercado no la publica)"""
+        return self._min_amounts.get(self._normalize_symbol(symbol), self.DEFAULT_MIN_AMOUNT)
+
     def validate_connection(self):
         try:
             if not self._light_check():
@@ -119,10 +218,20 @@ class ExchangeClient:
 
     def _get_nonce(self) -> int:
         current_nonce = int(time.time() * 1000)
-        self._last_nonce = max(current_nonce, self._last_nonce + 1)
-        return self._last_nonce
+        with self._nonce_lock:
+            self._last_nonce = max(current_nonce, self._last_nonce + 1)
+            return self._last_nonce
 
     def _normalize_symbol(self, symbol: str) -> str:
+        """Símbolo unificado de ccxt; los aciertos se memorizan hasta la próxima recarga de mercados"""
+        normalized = self._normalized_symbols.get(symbol)
+        if normalized is None:
+            normalized = self._resolve_symbol(symbol)
+            if len(self._normalized_symbols) < self.NORMALIZED_CACHE_MAX:
+                self._normalized_symbols[symbol] = normalized
+        return normalized
+
+    def _resolve_symbol(self, symbol: str) -> str:
         original_symbol = symbol
         symbol = symbol.upper().strip().replace('-', '/')
 
@@ -132,12 +241,12 @@ class ExchangeClient:
         if '/' not in symbol:
             raise ValueError(f"Símbolo mal formado: {original_symbol}")
 
-        if symbol in self.client.markets:
+        if symbol in self._valid_symbols:
             return symbol
 
-        for market_symbol in self.client.markets:
-            if symbol.replace('/', '') == market_symbol.replace('/', ''):
-                return market_symbol
+        market_symbol = self._compact_symbols.get(symbol.replace('/', ''))
+        if market_symbol is not None:
+            return market_symbol
 
         available = [k for k in self.client.markets.keys() if symbol.split('/')[0] in k]
         raise ValueError(
@@ -147,7 +256,7 @@ class ExchangeClient:
     def _validate_order_params(self, symbol: str, amount: float, price: float):
         market = self.client.market(symbol)
 
-        min_amount = float(market['limits']['amount']['min'])
+        min_amount = float(self.get_min_order_size(symbol))
         if amount < min_amount:
             raise ValueError(f"Cantidad {amount} menor al mínimo {min_amount} para {symbol}")
 
@@ -169,12 +278,12 @@ class ExchangeClient:
             precision = 8  # Valor seguro por defecto
 
         try:
-            try:
-                step = Decimal('1') / (Decimal('10') ** int(precision))
-            except Exception:
+            if 0 <= precision < len(self.AMOUNT_STEPS):
+                step = self.AMOUNT_STEPS[precision]
+            else:
                 logger.warning(f"Precision inválida para {symbol}: {precision}. Se usará 8 por defecto.")
                 precision = 8
-                step = Decimal('1') / (Decimal('10') ** 8)
+                step = self.AMOUNT_STEPS[8]
             amt = Decimal(str(amount)).quantize(step, rounding=ROUND_DOWN)
             logger.debug(f"Cantidad ajustada para {symbol}: {amt}")
             return float(amt)
@@ -199,7 +308,50 @@ class ExchangeClient:
 
     def fetch_ticker(self, symbol: str) -> Dict[str, Any]:
         normalized_symbol = self._normalize_symbol(symbol)
-        return self.client.fetch_ticker(normalized_symbol)
+        return self._cached_ticker(normalized_symbol)
+
+    def _cached_ticker(self, normalized_symbol: str) -> Dict[str, Any]:
+        """Ticker REST con caché de TICKER_CACHE_TTL; las llamadas concurrentes esperan a la primera"""
+        entry = self._ticker_cache.get(normalized_symbol)
+        if entry is not None and time.monotonic() - entry[0] < self.TICKER_CACHE_TTL:
+            return entry[1]
+        with self._ticker_cache_lock:
+            entry = self._ticker_cache.get(normalized_symbol)
+            if entry is not None and time.monotonic() - entry[0] < self.TICKER_CACHE_TTL:
+                return entry[1]
+            ticker = self.client.fetch_ticker(normalized_symbol)
+            self._ticker_cache[normalized_symbol] = (time.monotonic(), ticker)
+            return ticker
+
+    def subscribe_ticker(self, symbol: str) -> None:
+        """
+        Suscribe el símbolo al feed WebSocket de precios.
+        """
+        ticker_stream.subscribe(self._normalize_symbol(symbol))
+
+    def unsubscribe_ticker(self, symbol: str) -> None:
+        ticker_stream.unsubscribe(self._normalize_symbol(symbol))
+
+    def get_price(self, symbol: str) -> float:
+        """
+        Último precio: del feed WebSocket si es reciente, si no vía REST.
+        """
+        normalized_symbol = self._normalize_symbol(symbol)
+        price = ticker_stream.get_price(normalized_symbol)
+        if price is not None:
+            return price
+        return float(self._cached_ticker(normalized_symbol)['last'])
+
+    def get_bid(self, symbol: str) -> float:
+        """
+        Mejor bid: del feed WebSocket si es reciente, si no vía REST.
+        Evita un fetch_ticker en el camino de venta cuando el símbolo ya está suscrito.
+        """
+        normalized_symbol = self._normalize_symbol(symbol)
+        bid = ticker_stream.get_bid(normalized_symbol)
+        if bid is not None:
+            return bid
+        return float(self._cached_ticker(normalized_symbol)['bid'])
 
 # Instancia global con manejo de errores
 try:
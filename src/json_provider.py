@@ -0,0 +1,22 @@
+# src/json_provider.py
+from decimal import Decimal
+from typing import Any
+import orjson
+from flask.json.provider import JSONProvider
+
+
+def _default(obj: Any) -> Any:
+    """Tipos que orjson no serializa de forma nativa"""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Tipo no serializable: {type(obj).__name__}")
+
+
+class OrjsonProvider(JSONProvider):
+    """Proveedor JSON de Flask basado en orjson (parseo y serialización en C)"""
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs: Any) -> Any:
+        return orjson.loads(s)
@@ -27,12 +27,12 @@ class SignalProcessor:
             self.initialized = True
 
     def _configure_validations(self):
-        """Configuración centralizada de reglas de validación"""
+        """Configuración centralizada de reglas de validación (compiladas una sola vez)"""
         self.validation_rules = {
-            'required_fields': ['action', 'symbol', 'trailing_stop'],
-            'action_values': ['buy', 'sell'],
+            'required_fields': frozenset(('action', 'symbol', 'trailing_stop')),
+            'action_values': frozenset(('buy', 'sell')),
             'trailing_stop_range': (0.001, 0.2),  # 0.1% a 20%
-            'symbol_blacklist': ['TESTNET', 'FAKE']  # Pares problemáticos [4][6]
+            'symbol_blacklist': frozenset(('TESTNET', 'FAKE'))  # Pares problemáticos [4][6]
         }
 
     def process_signal(self, raw_signal: Dict) -> Optional[Dict]:
@@ -58,26 +58,47 @@ class SignalProcessor:
 
     def _validate_signal(self, signal: Dict) -> bool:
         """Validación de nivel profesional"""
-        # Validación de campos requeridos
-        if not all(field in signal for field in self.validation_rules['required_fields']):
+        rules = self.validation_rules
+
+        # Validación de campos requeridos (comparación de conjuntos en C)
+        if not isinstance(signal, dict) or not signal.keys() >= rules['required_fields']:
             logger.warning(f"Señal incompleta: {signal}")
             return False
             
         # Validación de acción permitida
-        if signal['action'].lower() not in self.validation_rules['action_values']:
-            logger.error(f"Acción inválida: {signal['action']}")
+        action = signal['action']
+        if not isinstance(action, str) or action.lower() not in rules['action_values']:
+            logger.error(f"Acción inválida: {action}")
             return False
             
         # Validación de trailing stop
-        trailing = float(signal.get('trailing_stop', 0))
-        min_t, max_t = self.validation_rules['trailing_stop_range']
+        try:
+            trailing = float(signal['trailing_stop'])
+        except (TypeError, ValueError):
+            logger.error(f"Trailing stop no numérico: {signal['trailing_stop']}")
+            return False
+        min_t, max_t = rules['trailing_stop_range']
         if not (min_t <= trailing <= max_t):
             logger.error(f"Trailing stop fuera de rango: {trailing}")
             return False
             
+        # Validación de take profit (opcional)
+        if 'take_profit' in signal:
+            try:
+                take_profit = float(signal['take_profit'])
+            except (TypeError, ValueError):
+                logger.error(f"Take profit no numérico: {signal['take_profit']}")
+                return False
+            if not take_profit >= 0:
+                logger.error(f"Take profit inválido: {take_profit}")
+                return False
+            
         # Validación de símbolos bloqueados [4][6]
+        if not isinstance(signal['symbol'], str):
+            logger.error(f"Símbolo inválido: {signal['symbol']}")
+            return False
         symbol = self._normalize_symbol(signal['symbol'])
-        if symbol in self.validation_rules['symbol_blacklist']:
+        if symbol in rules['symbol_blacklist']:
             logger.error(f"Símbolo bloqueado: {symbol}")
             return False
             
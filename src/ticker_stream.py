@@ -0,0 +1,132 @@
+# src/ticker_stream.py
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+import ccxt.pro as ccxtpro
+from ccxt.base.errors import NotSupported
+
+logger = logging.getLogger("TickerStream")
+
+# Antigüedad máxima (segundos) de un precio recibido por WebSocket
+MAX_PRICE_AGE = 30.0
+
+
+class TickerStream:
+    """
+    Feed de precios en tiempo real desde el WebSocket público de Kraken:
+    - Un único bucle asyncio en un hilo de fondo
+    - Una suscripción `ticker` por símbolo abierto
+    - Callbacks para despertar a los consumidores en cada tick
+    """
+
+    def __init__(self):
+        # symbol -> (último precio, mejor bid o None, instante monotónico)
+        self._prices: Dict[str, Tuple[float, Optional[float], float]] = {}
+        self._symbols = set()
+        # symbol -> tarea _watch en curso (una sola por símbolo)
+        self._tasks: Dict[str, Future] = {}
+        self._listeners: List[Callable[[str, float], None]] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._client = None
+        self._start_lock = threading.Lock()
+
+    def start(self) -> None:
+        """Arranca el bucle de eventos (idempotente)"""
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._loop = asyncio.new_event_loop()
+            self._client = ccxtpro.kraken({'enableRateLimit': True, 'asyncio_loop': self._loop})
+            self._thread = threading.Thread(target=self._loop.run_forever, daemon=True, name="TickerStream")
+            self._thread.start()
+            logger.info("Feed WebSocket de Kraken iniciado")
+
+    def stop(self) -> None:
+        """Cierra la conexión WebSocket y detiene el bucle"""
+        if self._thread is None:
+            return
+        with self._start_lock:
+            self._symbols.clear()
+            for task in self._tasks.values():
+                task.cancel()
+            self._tasks.clear()
+        try:
+            asyncio.run_coroutine_threadsafe(self._client.close(), self._loop).result(timeout=5)
+        except Exception as e:
+            logger.warning(f"Error cerrando WebSocket: {str(e)}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._thread = None
+        logger.info("Feed WebSocket de Kraken detenido")
+
+    def add_listener(self, callback: Callable[[str, float], None]) -> None:
+        """Registra un callback `callback(symbol, price)` para cada tick"""
+        self._listeners.append(callback)
+
+    def subscribe(self, symbol: str) -> None:
+        """Suscribe el símbolo (formato unificado, p.ej. BTC/EUR)"""
+        self.start()
+        with self._start_lock:
+            self._symbols.add(symbol)
+            task = self._tasks.get(symbol)
+            if task is not None and not task.done():
+                # El _watch anterior sigue vivo: lo reutiliza en vez de lanzar otro
+                return
+            self._tasks[symbol] = asyncio.run_coroutine_threadsafe(self._watch(symbol), self._loop)
+        logger.info(f"Suscrito al ticker de {symbol}")
+
+    def unsubscribe(self, symbol: str) -> None:
+        """Deja de seguir el símbolo y cancela su tarea de lectura"""
+        with self._start_lock:
+            self._symbols.discard(symbol)
+            task = self._tasks.pop(symbol, None)
+        if task is not None:
+            task.cancel()
+        self._prices.pop(symbol, None)
+
+    def get_price(self, symbol: str, max_age: float = MAX_PRICE_AGE) -> Optional[float]:
+        """Último precio recibido, o None si no hay dato reciente"""
+        entry = self._prices.get(symbol)
+        if entry is None or time.monotonic() - entry[2] > max_age:
+            return None
+        return entry[0]
+
+    def get_bid(self, symbol: str, max_age: float = MAX_PRICE_AGE) -> Optional[float]:
+        """Último bid recibido, o None si no hay dato reciente"""
+        entry = self._prices.get(symbol)
+        if entry is None or time.monotonic() - entry[2] > max_age:
+            return None
+        return entry[1]
+
+    async def _watch(self, symbol: str) -> None:
+        while symbol in self._symbols:
+            try:
+                ticker = await self._client.watch_ticker(symbol)
+            except NotSupported as e:
+                # Sin feed para este par: los consumidores siguen por REST (get_price devuelve None)
+                logger.warning(f"watch_ticker no soportado para {symbol}: {str(e)}. Se usará REST")
+                self._symbols.discard(symbol)
+                return
+            except Exception as e:
+                logger.warning(f"Error en WebSocket para {symbol}: {str(e)}. Reintentando...")
+                await asyncio.sleep(5)
+                continue
+
+            bid = ticker.get('bid')
+            price = ticker.get('last') or bid
+            if price is None or symbol not in self._symbols:
+                continue
+            self._prices[symbol] = (float(price), float(bid) if bid else None, time.monotonic())
+            for callback in self._listeners:
+                try:
+                    callback(symbol, float(price))
+                except Exception as e:
+                    logger.error(f"Error en listener de ticker: {str(e)}")
+
+
+# Instancia global (el hilo solo arranca con la primera suscripción)
+ticker_stream = TickerStream()
@@ -15,6 +15,7 @@ class Watcher:
         self.exchange = exchange_client
         self.running = False
         self.thread = None
+        self._subscribed = set()  # Símbolos con feed WebSocket abierto por este watcher
 
     def start(self):
         if not self.running:
@@ -39,8 +40,16 @@ class Watcher:
 
     def check_positions(self):
         positions = self.db.get_open_positions()
+        open_symbols = {position['symbol'] for position in positions}
+        # Posiciones cerradas fuera del watcher: se libera su feed
+        for symbol in self._subscribed - open_symbols:
+            self._unsubscribe(symbol)
         for position in positions:
             symbol = position['symbol']
+            if symbol not in self._subscribed:
+                # Una sola suscripción al abrirse la posición, no en cada vuelta
+                self.exchange.subscribe_ticker(symbol)
+                self._subscribed.add(symbol)
             current_price = self.exchange.get_price(symbol)
             trailing_stop = position.get('trailing_stop')
 
@@ -52,4 +61,10 @@ class Watcher:
             if current_price <= trailing_stop:
                 self.exchange.close_position(position['id'])
                 self.db.close_position(position['id'])
-                logger.info(f"Closed position {position['id']} for {symbol} due to trailing stop hit")
\ No newline at end of file
+                self._unsubscribe(symbol)
+                logger.info(f"Closed position {position['id']} for {symbol} due to trailing stop hit")
+
+    def _unsubscribe(self, symbol: str):
+        """Cierra el feed del símbolo (tarea WS y precio cacheado)"""
+        self.exchange.unsubscribe_ticker(symbol)
+        self._subscribed.discard(symbol)
\ No newline at end of file
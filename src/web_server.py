@@ -1,88 +1,180 @@
-import os
+import re
 import time
 import atexit
-import json
+import queue
 import logging
-from decimal import Decimal, getcontext
+from logging.handlers import QueueHandler, QueueListener
+from decimal import Decimal, getcontext, ROUND_DOWN
 from threading import Thread, Lock, Event
-from functools import wraps
+from functools import wraps, lru_cache
 from typing import Dict, Optional, Tuple
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
 import ccxt
-from src.config import INITIAL_CAPITAL, WEB_SERVER_PORT
+from src.config import (
+    INITIAL_CAPITAL, WEB_SERVER_PORT, ENVIRONMENT,
+    WAITRESS_THREADS, WAITRESS_CONN_LIMIT, WAITRESS_CHANNEL_TIMEOUT
+)
 from src.exchange import exchange_client
+from src.ticker_stream import ticker_stream
+from src.json_provider import OrjsonProvider
 from src.database import db_manager  # Nueva importación
 
 # =============================================
 # CONFIGURACIÓN GLOBAL MEJORADA
 # =============================================
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 getcontext().prec = 10  # Mayor precisión decimal
 
-# Configuración profesional de logging
+# Configuración profesional de logging (la escritura a disco ocurre en un hilo aparte)
+_log_queue = queue.Queue(-1)
+_log_listener = QueueListener(
+    _log_queue,
+    logging.StreamHandler(),
+    logging.FileHandler('trading_server.log'),
+    respect_handler_level=True
+)
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s | %(levelname)-8s | %(name)-22s | %(message)s',
     datefmt='%Y-%m-%d %H:%M:%S',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('trading_server.log')
-    ]
+    handlers=[QueueHandler(_log_queue)]
 )
+_log_listener.start()
+atexit.register(_log_listener.stop)
 logger = logging.getLogger('TradingEngine')
 
-# =============================================
-# DECORADORES MEJORADOS
-# =============================================
-def synchronized(lock_name: str):
-    """Decorador thread-safe con timeout"""
-    def decorator(func):
-        @wraps(func)
-        def wrapper(self, *args, **kwargs):
-            lock = getattr(self, lock_name)
-            if not lock.acquire(timeout=15):  # Timeout de 15 segundos
-                raise TimeoutError(f"No se pudo obtener lock {lock_name}")
-            try:
-                return func(self, *args, **kwargs)
-            finally:
-                lock.release()
-        return wrapper
-    return decorator
+# Caché de símbolos canónicos (BTC-eur -> BTC/EUR); el universo de pares es pequeño
+_SYMBOL_CANON: Dict[str, str] = {}
+_SYMBOL_CANON_MAX = 512
+
+# Mayúsculas ASCII + '-' -> '/' en una sola pasada
+_SYMBOL_XLATE = str.maketrans({**{chr(c): chr(c - 32) for c in range(ord('a'), ord('z') + 1)}, '-': '/'})
+
+def canonical_symbol(raw: str) -> str:
+    """Normaliza el símbolo del webhook con una sola búsqueda en el caso habitual"""
+    canon = _SYMBOL_CANON.get(raw)
+    if canon is None:
+        canon = raw.translate(_SYMBOL_XLATE)
+        if len(_SYMBOL_CANON) < _SYMBOL_CANON_MAX:
+            _SYMBOL_CANON[raw] = canon
+    return canon
+
+@lru_cache(maxsize=64)
+def _error_body(message: str) -> str:
+    """Cuerpo {"error": ...} serializado una sola vez por mensaje (el conjunto de mensajes es pequeño)"""
+    return app.json.dumps({"error": message})
+
+def error_response(message: str, status: int):
+    """Respuesta de error JSON a partir del cuerpo precalculado"""
+    return app.response_class(_error_body(message), status=status, mimetype='application/json')
+
+@app.before_request
+def reject_non_json_posts():
+    """Corta los POST sin JSON antes del enrutado y de get_json()"""
+    if request.method == 'POST' and not request.is_json:
+        logger.warning("Intento de webhook no JSON desde %s", request.remote_addr)
+        return error_response("Content-Type debe ser application/json", 415)
+
+# Reglas del payload, construidas una sola vez al importar
+_WEBHOOK_REQUIRED = ('action', 'symbol')
+_WEBHOOK_ACTIONS = frozenset(('buy', 'sell'))
+_TRAILING_RANGE = (0.001, 0.2)  # 0.1% a 20% [7]
+_BOOL_STRINGS = {'true': True, 'false': False}
+# Espera máxima por un tick del WebSocket antes de consultar el precio por REST
+PRICE_WAIT_TIMEOUT = 30
+# Punto fijo entero (unidades de 1e-8) para el bucle de monitorización
+SATS = 10 ** 8
+# Constantes decimales precalculadas (evita re-parsear cadenas en cada operación)
+ZERO = Decimal('0')
+ONE = Decimal('1')
+DEFAULT_TRAILING = Decimal('0.02')
+SATOSHI = Decimal('0.00000001')
+# Vida máxima de una posición antes de liquidarla (ns de reloj monotónico)
+POSITION_TIMEOUT_NS = 30 * 60 * 10 ** 9
+_SYMBOL_RE = re.compile(r'^[A-Z0-9]{2,10}/[A-Z0-9]{2,10}$')  # BASE/QUOTE ya canonicalizado
+
+
+def to_decimal(value) -> Decimal:
+    """float/str/int a Decimal; los NUMERIC de la DB ya llegan como Decimal y se devuelven tal cual"""
+    if isinstance(value, Decimal):
+        return value
+    if isinstance(value, float):
+        return Decimal(repr(value))
+    return Decimal(value)
+
+
+def _as_number(value) -> Optional[float]:
+    """Número (o cadena numérica) a float; None si no lo es"""
+    if isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _as_bool(value) -> Optional[bool]:
+    """Booleano JSON o cadena "true"/"false"; None para cualquier otra cosa"""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        return _BOOL_STRINGS.get(value.strip().lower())
+    return None
+
+def _webhook_error(data) -> Optional[Tuple[str, str]]:
+    """Valida el payload en una sola pasada; devuelve (log, respuesta) del primer error o None"""
+    if not isinstance(data, dict):
+        return "Payload no es un objeto JSON", "Se esperaba un objeto JSON"
+
+    missing = [field for field in _WEBHOOK_REQUIRED if field not in data]
+    if missing:
+        return f"Campos faltantes: {', '.join(missing)}", f"Campos requeridos faltantes: {', '.join(missing)}"
+
+    action, symbol = data['action'], data['symbol']
+    if not isinstance(action, str) or action.lower() not in _WEBHOOK_ACTIONS:
+        return f"Acción inválida: {action}", "Acción no válida"
+    if not isinstance(symbol, str) or _SYMBOL_RE.match(canonical_symbol(symbol)) is None:
+        return f"Símbolo inválido: {symbol}", "Símbolo inválido"
+
+    if action.lower() == 'buy':
+        if 'trailing_stop' not in data:
+            return "Falta trailing_stop", "Parámetro trailing_stop requerido para compras"
+        trailing = _as_number(data['trailing_stop'])
+        min_t, max_t = _TRAILING_RANGE
+        if trailing is None or not min_t <= trailing <= max_t:
+            return f"Trailing stop inválido: {data['trailing_stop']}", "Trailing stop debe estar entre 0.1% y 20%"
+
+    if 'take_profit' in data:
+        take_profit = _as_number(data['take_profit'])
+        if take_profit is None or not take_profit >= 0:
+            return f"Take profit inválido: {data['take_profit']}", "take_profit debe ser un número >= 0"
+
+    if 'market' in data and _as_bool(data['market']) is None:
+        return f"market inválido: {data['market']}", "market debe ser true o false"
+
+    return None
 
 def validate_webhook(f):
     """Validador mejorado de webhooks con auditoría"""
     @wraps(f)
     def wrapper(*args, **kwargs):
-        start_time = time.time()
+        start_time = time.perf_counter()
         client_ip = request.remote_addr
         
         try:
-            if not request.is_json:
-                logger.warning(f"Intento de webhook no JSON desde {client_ip}")
-                return jsonify({"error": "Content-Type debe ser application/json"}), 415
-                
-            data = request.get_json()
-            logger.info(f"Webhook recibido desde {client_ip}: {json.dumps(data)}")
+            data = request.get_json(cache=True, silent=True)
+            logger.debug("Webhook recibido desde %s: %s", client_ip, data)
             
-            # Validación extendida
-            required_fields = {'action', 'symbol'}
-            missing = required_fields - set(data.keys())
-            if missing:
-                logger.warning(f"Campos faltantes desde {client_ip}: {', '.join(missing)}")
-                return jsonify({"error": f"Campos requeridos faltantes: {', '.join(missing)}"}), 400
-                
-            if data['action'].lower() == 'buy':
-                if 'trailing_stop' not in data:
-                    logger.warning(f"Falta trailing_stop desde {client_ip}")
-                    return jsonify({"error": "Parámetro trailing_stop requerido para compras"}), 400
-                
-                if not 0.001 <= float(data['trailing_stop']) <= 0.2:  # Validación de rango [7]
-                    logger.warning(f"Trailing stop inválido desde {client_ip}: {data['trailing_stop']}")
-                    return jsonify({"error": "Trailing stop debe estar entre 0.1% y 20%"}), 400
+            error = _webhook_error(data)
+            if error:
+                log_message, response_message = error
+                logger.warning("%s desde %s", log_message, client_ip)
+                return error_response(response_message, 400)
             
+            g.webhook_data = data
             return f(*args, **kwargs)
         finally:
-            logger.info(f"Webhook procesado en {time.time() - start_time:.2f}s")
+            logger.info("Webhook procesado en %.2fs", time.perf_counter() - start_time)
     return wrapper
 
 # =============================================
@@ -92,28 +184,48 @@ class TradingEngine:
     def __init__(self):
         self._lock = Lock()
         self._shutdown_event = Event()
-        self._position_lock = Lock()
-        self._operation_lock = Lock()
+        self._buy_in_progress = False
+        self._sell_in_progress = False
+        # Generación de la posición: cambia en cada compra, invalida monitores y ventas antiguas
+        self._position_gen = 0
         self._state = self._load_initial_state()
+        self._publish_snapshot()
+        
+        # Ticks del WebSocket para la posición abierta (consumidos por _manage_position)
+        self._ticks: queue.Queue = queue.Queue()
+        ticker_stream.add_listener(self._on_tick)
+        
+        # Un único supervisor de posición para toda la vida del motor
+        self._position_open = Event()
+        if self._state['active']:
+            self._position_open.set()
+        Thread(target=self._supervisor_loop, daemon=True, name="PositionSupervisor").start()
         
         logger.info("Motor inicializado | Capital: €%.2f", self.current_capital)
 
     def _load_initial_state(self) -> Dict:
         """Carga estado inicial desde PostgreSQL"""
+        capital = to_decimal(INITIAL_CAPITAL)
         try:
+            balance = db_manager.get_capital()
+            if balance is not None:
+                capital = to_decimal(balance)
             result = db_manager.execute_query(
-                "SELECT * FROM positions WHERE closed = FALSE ORDER BY created_at DESC LIMIT 1"
+                "SELECT symbol, amount, entry_price, trailing_pct, highest_price FROM positions "
+                "WHERE status = 'open' ORDER BY created_at DESC LIMIT 1"
             )
             if result:
-                position = result[0]
-                logger.info("Estado recuperado de DB: %s", position['symbol'])
+                symbol, amount, entry_price, trailing_pct, highest_price = result[0]
+                logger.info("Estado recuperado de DB: %s", symbol)
                 return {
                     'active': True,
-                    'symbol': position['symbol'],
-                    'entry_price': Decimal(str(position['entry_price'])),
-                    'size': Decimal(str(position['size'])),
-                    'trailing_stop': Decimal(str(position['trailing_stop'])),
-                    'capital': Decimal(str(position['remaining_capital']))
+                    'symbol': symbol,
+                    'entry_price': to_decimal(entry_price),
+                    'size': to_decimal(amount),
+                    'trailing_stop': to_decimal(trailing_pct),
+                    'capital': capital,
+                    'last_update': time.monotonic_ns(),
+                    'max_price': to_decimal(highest_price)
                 }
         except Exception as e:
             logger.error("Error cargando estado inicial: %s", str(e))
@@ -121,91 +233,113 @@ class TradingEngine:
         return {
             'active': False,
             'symbol': None,
-            'entry_price': Decimal('0'),
-            'size': Decimal('0'),
-            'trailing_stop': Decimal('0.02'),
-            'capital': Decimal(str(INITIAL_CAPITAL))
+            'entry_price': ZERO,
+            'size': ZERO,
+            'trailing_stop': DEFAULT_TRAILING,
+            'capital': capital
         }
 
     @property
     def current_capital(self) -> Decimal:
         return self._state['capital']
 
-    @synchronized('_lock')
-    def execute_buy(self, symbol: str, trailing_stop: float) -> Tuple[bool, str]:
-        """Lógica de compra mejorada con validación completa"""
-        normalized = exchange_client._normalize_symbol(symbol)
-        market = exchange_client.client.market(normalized)
-        if not market:
+    @property
+    def snapshot(self) -> Tuple[bool, Optional[str], Decimal]:
+        """(activa, símbolo, capital) coherentes entre sí; lectura sin lock"""
+        return self._snapshot
+
+    def _publish_snapshot(self):
+        """Publica el estado tras cada cambio (una sola asignación atómica)"""
+        self._snapshot = (self._state['active'], self._state['symbol'], self._state['capital'])
+
+    def _prepare_buy(self) -> bool:
+        """Reclama el motor para una compra (transición corta bajo lock, sin I/O)"""
+        with self._lock:
+            if self._state['active'] or self._buy_in_progress:
+                return False
+            self._buy_in_progress = True
+            return True
+
+    def _commit_buy(self, symbol: str, price: Decimal, amount: Decimal, trailing_stop: float):
+        """Publica la posición recién comprada"""
+        with self._lock:
+            self._position_gen += 1
+            self._state.update({
+                'active': True,
+                'symbol': symbol,
+                'entry_price': price,
+                'size': amount,
+                'trailing_stop': to_decimal(trailing_stop),
+                'capital': ZERO,
+                'last_update': time.monotonic_ns(),
+                'max_price': price,  # Inicializar max_price con entry price
+            })
+            self._publish_snapshot()
+            # set()/clear() bajo el mismo lock que el estado: ninguna señal al supervisor se pierde
+            self._position_open.set()
+
+    def execute_buy(self, symbol: str, trailing_stop: float, market: bool = False) -> Tuple[bool, str]:
+        """
+        Lógica de compra mejorada con validación completa.
+        El lock solo cubre la reclamación y la publicación del estado; las llamadas
+        a Kraken y a la DB se hacen sin él.
+        """
+        try:
+            min_amount = exchange_client.get_min_order_size(symbol)
+        except ValueError:
             return False, f"Par {symbol} no disponible"
 
+        if not self._prepare_buy():
+            return False, "Ya hay una posición abierta o una compra en curso"
+
         try:
-            with self._operation_lock:
-                # Obtener precio actual
-                ticker = exchange_client.fetch_ticker(symbol)
-                price = Decimal(str(ticker['ask']))
-                
-                # Calcular cantidad con precisión
-                amount = (self.current_capital / price).quantize(Decimal('0.00000001'))
-                
-                # Validar límites del mercado
-                if amount < Decimal(str(market['limits']['amount']['min'])):
-                    return False, f"Monto mínimo no alcanzado: {market['limits']['amount']['min']}"
-                
-                # Ejecutar orden
-                payload = request.get_json() if request else {}
-                logger.info(f"Orden {('MARKET' if payload.get('market') else 'LIMIT')} -> {symbol} | amount={amount} | price={price}")
-                if payload.get("market", False):
-                    order = exchange_client.create_market_order(
-                        symbol=symbol,
-                        side="buy",
-                        amount=float(amount),
-                        trailing_stop=trailing_stop
-                    )
-                else:
-                    order = exchange_client.create_limit_order(
-                        symbol=symbol,
-                        side="buy",
-                        amount=float(amount),
-                        price=float(price)
-                    )
-                
-                # Actualizar estado
-                self._state.update({
-                    'active': True,
-                    'symbol': symbol,
-                    'entry_price': price,
-                    'size': amount,
-                    'trailing_stop': Decimal(str(trailing_stop)),
-                    'capital': Decimal('0'),
-                    'last_update': time.time(),
-                    'max_price': price,  # Inicializar max_price con entry price
-                })
-                
-                # Persistir en DB usando modelo Position
-                from src.models import Position  # Asegúrate de que esta importación exista
-
-                pos = Position(
+            # Obtener precio actual
+            ticker = exchange_client.fetch_ticker(symbol)
+            price = to_decimal(ticker['ask'])
+            
+            # Calcular cantidad con precisión
+            amount = (self.current_capital / price).quantize(SATOSHI, rounding=ROUND_DOWN)
+            
+            # Validar límites del mercado
+            if amount < min_amount:
+                return False, f"Monto mínimo no alcanzado: {min_amount}"
+            
+            # Ejecutar orden
+            logger.info("Orden %s -> %s | amount=%s | price=%s", 'MARKET' if market else 'LIMIT', symbol, amount, price)
+            if market:
+                order = exchange_client.create_market_order(
+                    symbol=symbol,
+                    side="buy",
+                    amount=float(amount),
+                    trailing_stop=trailing_stop
+                )
+            else:
+                order = exchange_client.create_limit_order(
                     symbol=symbol,
+                    side="buy",
                     amount=float(amount),
-                    entry_price=float(price),
-                    highest_price=float(price),
-                    trailing_pct=trailing_stop,
-                    stop_price=float(price * (Decimal('1') - Decimal(str(trailing_stop)))),
-                    status="open"
+                    price=float(price)
+                )
+            
+            # Actualizar estado y despertar al supervisor (aunque falle la persistencia)
+            self._commit_buy(symbol, price, amount, trailing_stop)
+            
+            # Persistir posición y capital en una sola sentencia (un round trip, una transacción).
+            # La orden ya está ejecutada: un fallo de DB se registra pero la compra es válida
+            try:
+                db_manager.execute_query(
+                    "WITH opened AS ("
+                    "INSERT INTO positions (symbol, side, amount, entry_price, trailing_pct, highest_price, stop_price, status) "
+                    "VALUES (%s, 'buy', %s, %s, %s, %s, %s, 'open')"
+                    ") UPDATE capital SET balance = %s WHERE id = 1",
+                    (symbol, float(amount), float(price), trailing_stop, float(price),
+                     float(price * (ONE - to_decimal(trailing_stop))), 0.0)
                 )
-                db_manager.insert_position(pos)
-                db_manager.execute_query("UPDATE capital SET balance = %s", (0.0,))
-                
-                # Iniciar monitorización
-                Thread(
-                    target=self._manage_position,
-                    daemon=True,
-                    name=f"PositionManager-{symbol}"
-                ).start()
-                
-                return True, order['id']
-                
+            except Exception as e:
+                logger.critical("Error persistiendo compra: %s", str(e), exc_info=True)
+            
+            return True, order['id']
+            
         except ccxt.InsufficientFunds as e:
             logger.critical("Fondos insuficientes en exchange: %s", str(e))
             return False, str(e)
@@ -213,96 +347,188 @@ class TradingEngine:
             logger.error("Error en compra: %s", str(e), exc_info=True)
             db_manager.log_error("buy_error", str(e))
             return False, str(e)
+        finally:
+            with self._lock:
+                self._buy_in_progress = False
+
+    def _supervisor_loop(self):
+        """Espera a que haya posición abierta y la monitoriza; sin hilos por compra"""
+        while not self._shutdown_event.is_set():
+            self._position_open.wait()
+            if self._shutdown_event.is_set():
+                break
+            generation = self._position_gen
+            try:
+                self._manage_position()
+            except Exception as e:
+                logger.error("Error iniciando monitorización: %s", str(e))
+            if self._state['active'] and self._position_gen == generation:
+                # La venta falló: reintentar tras una pausa (una recompra se monitoriza ya)
+                self._shutdown_event.wait(60)
+
+    def _on_tick(self, market: str, price: float):
+        """Callback del feed WebSocket: encola el precio si es del par en posición"""
+        if market == self._state.get('market'):
+            self._ticks.put(price)
+
+    def _next_price(self, symbol: str) -> Optional[int]:
+        """
+        Bloquea hasta el siguiente tick (el más reciente si hay varios); REST si no llega ninguno.
+        Devuelve el precio en enteros 1e-8, o None si la posición se cerró mientras esperaba.
+        """
+        try:
+            price = self._ticks.get(timeout=PRICE_WAIT_TIMEOUT)
+        except queue.Empty:
+            return round(exchange_client.get_price(symbol) * SATS)
+        while price is not None:
+            try:
+                latest = self._ticks.get_nowait()
+            except queue.Empty:
+                return round(price * SATS)
+            price = latest
+        return None
 
     def _manage_position(self):
         """Monitorización activa de la posición con trailing stop basado en max_price"""
-        logger.info("Iniciando monitorización de posición para %s", self._state['symbol'])
-        while self._state['active'] and not self._shutdown_event.is_set():
+        # Referencias locales: el bucle no repite búsquedas de atributos por tick
+        state, shutdown_event, next_price = self._state, self._shutdown_event, self._next_price
+        with self._lock:
+            generation, symbol = self._position_gen, state['symbol']
+            max_price, trailing_stop = state['max_price'], state['trailing_stop']
+        logger.info("Iniciando monitorización de posición para %s", symbol)
+        while not self._ticks.empty():
+            self._ticks.get_nowait()
+        state['market'] = exchange_client._normalize_symbol(symbol)
+        exchange_client.subscribe_ticker(symbol)
+        # El bucle trabaja en enteros; el Decimal solo se reconstruye al subir el máximo
+        max_price_i = int(max_price * SATS)
+        trail_factor_i = int((ONE - trailing_stop) * SATS)
+        # Una venta y recompra cambian la generación: este bucle deja la nueva posición a otro
+        while state['active'] and self._position_gen == generation and not shutdown_event.is_set():
             try:
                 # Timeout de posición (30 minutos)
-                if time.time() - self._state['last_update'] > 1800:
+                # (last_update se relee: una recompra lo reinicia)
+                if time.monotonic_ns() - state['last_update'] > POSITION_TIMEOUT_NS:
                     logger.warning("Timeout de posición, liquidando...")
-                    self.execute_sell()
+                    self.execute_sell(generation)
                     break
 
                 # Update maximum price seen since entry
-                current_price = Decimal(str(exchange_client.fetch_ticker(self._state['symbol'])['last']))
-                with self._position_lock:
-                    if current_price > self._state.get('max_price', Decimal('0')):
-                        self._state['max_price'] = current_price
+                price_i = next_price(symbol)
+                if price_i is None:
+                    continue  # Posición cerrada durante la espera: re-evalúa la condición del bucle
+                if price_i > max_price_i:
+                    max_price_i = price_i
+                    with self._lock:
+                        if self._position_gen == generation:
+                            state['max_price'] = Decimal(price_i).scaleb(-8)
 
                 # Compute trailing stop price based on max_price
-                stop_price = self._state['max_price'] * (Decimal('1') - self._state['trailing_stop'])
+                stop_price_i = max_price_i * trail_factor_i // SATS
 
                 # Check if stop hit
-                if current_price <= stop_price:
-                    logger.info("Trailing stop activado a %.4f", stop_price)
-                    self.execute_sell()
+                if price_i <= stop_price_i:
+                    logger.info("Trailing stop activado a %.4f", stop_price_i / SATS)
+                    self.execute_sell(generation)
                     break
 
-                time.sleep(30)
-
             except Exception as e:
                 logger.error("Error en monitorización: %s", str(e))
                 db_manager.log_error("position_manager_error", str(e))
-                time.sleep(60)
+                shutdown_event.wait(60)
 
-    @synchronized('_lock')
-    def execute_sell(self) -> Tuple[bool, str]:
-        """Lógica de venta con manejo de errores"""
-        if not self._state['active']:
-            return False, "Sin posición activa"
+    def _prepare_sell(self, generation: Optional[int] = None) -> Optional[str]:
+        """Reclama la posición para venderla (sin I/O); devuelve el motivo si no es posible"""
+        with self._lock:
+            if not self._state['active']:
+                return "Sin posición activa"
+            if generation is not None and generation != self._position_gen:
+                return "La posición ya no es la monitorizada"
+            if self._sell_in_progress:
+                return "Venta ya en curso"
+            self._sell_in_progress = True
+            return None
 
+    def _commit_sell(self, new_capital: Decimal):
+        """Cierra la posición en memoria"""
+        with self._lock:
+            self._state.update({
+                'active': False,
+                'capital': new_capital,
+                'symbol': None,
+                'market': None,
+                'size': ZERO
+            })
+            self._publish_snapshot()
+            self._position_open.clear()
+        self._ticks.put(None)  # Despierta al monitor bloqueado en _next_price
+
+    def execute_sell(self, generation: Optional[int] = None) -> Tuple[bool, str]:
+        """
+        Lógica de venta con manejo de errores (órdenes y DB fuera del lock).
+        `generation` limita la venta a esa posición concreta (ventas del monitor).
+        """
+        reason = self._prepare_sell(generation)
+        if reason is not None:
+            return False, reason
+
+        # Mientras la venta está reclamada nadie más modifica la posición
+        symbol, size, entry_price = self._state['symbol'], self._state['size'], self._state['entry_price']
         try:
-            # Obtener datos de mercado
-            ticker = exchange_client.fetch_ticker(self._state['symbol'])
-            price = Decimal(str(ticker['bid']))
+            # Bid del feed WebSocket (la posición está suscrita); REST solo como respaldo
+            price = to_decimal(exchange_client.get_bid(symbol))
             
             # Intentar venta limitada primero, luego market
             try:
                 order = exchange_client.create_limit_order(
-                    symbol=self._state['symbol'],
+                    symbol=symbol,
                     side='sell',
-                    amount=float(self._state['size']),
+                    amount=float(size),
                     price=float(price)
                 )
             except ccxt.InvalidOrder:
                 order = exchange_client.create_market_order(
-                    symbol=self._state['symbol'],
+                    symbol=symbol,
                     side='sell',
-                    amount=float(self._state['size'])
+                    amount=float(size)
                 )
             
-            # Calcular nuevo capital
-            new_capital = self._state['size'] * price
-            
-            # Actualizar estado
-            self._state.update({
-                'active': False,
-                'capital': new_capital,
-                'symbol': None,
-                'size': Decimal('0')
-            })
+            # Calcular nuevo capital y actualizar estado
+            new_capital = size * price
+            # Beneficio de la operación (mismo valor en DB y en el log)
+            profit = size * (price - entry_price)
+            self._commit_sell(new_capital)
+            exchange_client.unsubscribe_ticker(symbol)
             
             # Persistir en DB
-            db_manager.transactional([
-                ("UPDATE positions SET exit_price = %s, closed = TRUE, profit = %s WHERE closed = FALSE",
-                 (float(price), float(new_capital - INITIAL_CAPITAL))),
-                ("UPDATE capital SET balance = %s", (float(new_capital),))
-            ])
+            # Cierre y capital en una sola sentencia (un round trip, una transacción).
+            # La orden ya está ejecutada: un fallo de DB se registra pero la venta es válida
+            try:
+                db_manager.execute_query(
+                    "WITH closed AS ("
+                    "UPDATE positions SET status = 'closed', exit_price = %s, profit = %s WHERE status = 'open'"
+                    ") UPDATE capital SET balance = %s WHERE id = 1",
+                    (float(price), float(profit), float(new_capital))
+                )
+            except Exception as e:
+                logger.critical("Error persistiendo venta: %s", str(e), exc_info=True)
             
-            logger.info("Venta ejecutada correctamente. Beneficio: €%.2f", new_capital - INITIAL_CAPITAL)
+            logger.info("Venta ejecutada correctamente. Beneficio: €%.2f | Capital: €%.2f", profit, new_capital)
             return True, order['id']
             
         except Exception as e:
             logger.critical("Error en venta: %s", str(e), exc_info=True)
             db_manager.log_error("sell_error", str(e))
             return False, str(e)
+        finally:
+            with self._lock:
+                self._sell_in_progress = False
 
     def shutdown(self):
         """Protocolo de apagado seguro"""
         logger.info("Iniciando secuencia de apagado...")
         self._shutdown_event.set()
+        self._position_open.set()  # Libera al supervisor si está en espera
         
         try:
             if self._state['active']:
@@ -316,38 +542,95 @@ class TradingEngine:
         db_manager.close()
         logger.info("Motor detenido correctamente")
 
+@lru_cache(maxsize=1)
+def get_engine() -> TradingEngine:
+    """Instancia única y perezosa del motor (un solo cliente, un solo set de handlers)"""
+    engine = TradingEngine()
+    atexit.register(engine.shutdown)
+    Thread(target=_health_refresher, args=(engine,), daemon=True, name="HealthRefresher").start()
+    return engine
+
 # =============================================
 # ENDPOINTS API OPTIMIZADOS
 # =============================================
-@app.route('/health', methods=['GET'])
-def health_check():
-    """Endpoint de salud mejorado"""
+# Respuesta de /health precalculada (línea de estado, cuerpo); un hilo la refresca cada _HEALTH_TTL segundos
+_HEALTH_TTL = 5.0
+_health_response = ('503 Service Unavailable', app.json.dumps({"status": "iniciando"}).encode())
+
+def _health_payload(engine: TradingEngine) -> Dict:
+    """Cuerpo de /health a partir del snapshot del motor y de una prueba de conexión a la DB"""
+    active, _, capital = engine.snapshot
     try:
         db_status = "ok" if db_manager.test_connection() else "error"
     except Exception as e:
         db_status = f"error: {str(e)}"
-    
-    return jsonify({
+    return {
         "status": "operacional",
         "timestamp": time.time(),
-        "position_active": trading_engine._state['active'],
-        "current_capital": float(trading_engine.current_capital),
+        "position_active": active,
+        "current_capital": capital,
         "database_status": db_status,
-        "environment": os.getenv("ENV", "production")
-    }), 200
+        "environment": ENVIRONMENT
+    }
+
+def _refresh_health(engine: TradingEngine):
+    """Recalcula los bytes de /health fuera del camino de la petición; 503 si falla"""
+    global _health_response
+    try:
+        _health_response = ('200 OK', app.json.dumps(_health_payload(engine)).encode())
+    except Exception as e:
+        logger.error("Health check fallido: %s", str(e))
+        _health_response = ('503 Service Unavailable', app.json.dumps({"status": "error"}).encode())
+
+def _health_refresher(engine: TradingEngine):
+    """Hilo de fondo: refresca /health hasta el apagado del motor"""
+    while True:
+        _refresh_health(engine)
+        if engine._shutdown_event.wait(_HEALTH_TTL):
+            break
+
+@app.route('/health', methods=['GET'])
+def health_check():
+    """Endpoint de salud (HEAD y métodos no cubiertos por FastHealth); mismos bytes precalculados"""
+    status, body = _health_response
+    return app.response_class(body, status=int(status[:3]), mimetype='application/json')
+
+class FastHealth:
+    """
+    Middleware WSGI: responde GET /health antes del enrutado de Flask
+    con los bytes precalculados por _health_refresher (sin I/O ni serialización por petición).
+    """
+
+    def __init__(self, inner):
+        self.inner = inner
+
+    def __call__(self, environ, start_response):
+        if environ.get('PATH_INFO') == '/health' and environ.get('REQUEST_METHOD') == 'GET':
+            status, body = _health_response
+            start_response(status, [
+                ('Content-Type', 'application/json'),
+                ('Content-Length', str(len(body)))
+            ])
+            return [body]
+        return self.inner(environ, start_response)
+
+app.wsgi_app = FastHealth(app.wsgi_app)
 
 @app.route('/webhook', methods=['POST'])
 @validate_webhook
 def handle_signal():
     """Manejador profesional de señales"""
-    data = request.get_json()
+    trading_engine = get_engine()
+    data = g.webhook_data
     action = data['action'].lower()
-    symbol = data['symbol'].upper().replace('-', '/')
+    symbol = canonical_symbol(data['symbol'])
     
     try:
         if action == 'buy':
             trailing = float(data['trailing_stop'])
-            success, order_id = trading_engine.execute_buy(symbol, trailing)
+            success, order_id = trading_engine.execute_buy(
+                symbol, trailing, market=_as_bool(data.get('market', False))
+            )
             
             response = {
                 "status": "success" if success else "error",
@@ -370,12 +653,12 @@ def handle_signal():
             db_manager.log_webhook(data, response, status_code)
             return jsonify(response), status_code
             
-        return jsonify({"error": "Acción no válida"}), 400
+        return error_response("Acción no válida", 400)
         
     except Exception as e:
         logger.error("Error en webhook: %s", str(e), exc_info=True)
         db_manager.log_error("webhook_error", str(e))
-        return jsonify({"error": "Error interno del servidor"}), 500
+        return error_response("Error interno del servidor", 500)
 
 # =============================================
 # INICIALIZACIÓN ROBUSTA
@@ -383,9 +666,7 @@ def handle_signal():
 def run_server():
     """Lanzador profesional mejorado"""
     try:
-        global trading_engine
-        trading_engine = TradingEngine()
-        atexit.register(trading_engine.shutdown)
+        get_engine()
         logger.info("Servicio inicializado correctamente")
     except Exception as e:
         logger.critical("Error de inicialización: %s", str(e))
@@ -396,16 +677,17 @@ def run_server():
         app,
         host="0.0.0.0",
         port=WEB_SERVER_PORT,
-        threads=4,
-        channel_timeout=600,
-        connection_limit=50
+        threads=WAITRESS_THREADS,
+        channel_timeout=WAITRESS_CHANNEL_TIMEOUT,
+        connection_limit=WAITRESS_CONN_LIMIT,
+        asyncore_use_poll=True  # poll() en vez de select(): sin límite de FD_SETSIZE
     )
 
 if __name__ == '__main__':
     print("\n" + "="*50)
     print("🚀 SERVICIO DE TRADING AUTOMATIZADO - PRODUCCIÓN")
     print(f"• Endpoint: http://0.0.0.0:{WEB_SERVER_PORT}")
-    print(f"• Entorno: {os.getenv('ENV', 'production')}")
+    print(f"• Entorno: {ENVIRONMENT}")
     print(f"• Capital inicial: {INITIAL_CAPITAL}€")
     print("="*50 + "\n")
 
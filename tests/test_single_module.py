@@ -0,0 +1,11 @@
+import ast
+from pathlib import Path
+
+WEB_SERVER = Path(__file__).resolve().parent.parent / 'src' / 'web_server.py'
+
+
+def test_single_trading_engine():
+    """web_server.py debe definir un único TradingEngine (sin copias duplicadas del módulo)"""
+    tree = ast.parse(WEB_SERVER.read_text(encoding='utf-8'))
+    engines = [node for node in tree.body if isinstance(node, ast.ClassDef) and node.name == 'TradingEngine']
+    assert len(engines) == 1